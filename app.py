@@ -3,6 +3,12 @@ import base64
 import time
 import json
 import re
+import os
+import hashlib
+import tempfile
+import threading
+import html
+from functools import lru_cache
 import google.generativeai as genai
 
 # ==========================================
@@ -38,6 +44,41 @@ AVAILABLE_MODELS = [
     "gemini-pro"
 ]
 
+# ความยาวสูงสุดของชื่ออาชีพที่พิมพ์ได้ (ตัวอักษร)
+CAREER_NAME_MAX_CHARS = 100
+
+# งบประมาณ Token ต่อโมเดล (input = ขนาด Prompt สูงสุด)
+# Prompt แบบเต็มหลัง Minify ราว 900 ตัวอักษร (~300-400 Tokens) + ชื่ออาชีพไม่เกิน CAREER_NAME_MAX_CHARS
+# max_output_tokens = ค่าเริ่มต้นของ max_output_tokens (รวม Thinking Tokens ของโมเดล 2.5)
+# output_token_ceiling = เพดานสูงสุดของโมเดล (ปรับเพิ่มจากค่าที่วัดได้จริงไม่เกินค่านี้)
+# "variant" คือ Prompt ที่ใช้ตามปกติ ("full" หรือ "compact")
+DEFAULT_TOKEN_BUDGET = {"max_input_tokens": 600, "max_output_tokens": 8192, "output_token_ceiling": 8192, "variant": "full"}
+MODEL_TOKEN_BUDGETS = {
+    "gemini-2.5-flash-preview-09-2025": {"max_input_tokens": 600, "max_output_tokens": 16384, "output_token_ceiling": 65536, "variant": "full"},
+    "gemini-1.5-flash": {"max_input_tokens": 600, "max_output_tokens": 8192, "output_token_ceiling": 8192, "variant": "full"},
+    "gemini-1.5-pro": {"max_input_tokens": 600, "max_output_tokens": 8192, "output_token_ceiling": 8192, "variant": "full"},
+    "gemini-pro": {"max_input_tokens": 600, "max_output_tokens": 2048, "output_token_ceiling": 2048, "variant": "full"},
+}
+# เผื่อ max_output_tokens เป็นกี่เท่าของ Output + Thinking สูงสุดที่เคยวัดได้
+OUTPUT_TOKEN_HEADROOM = 1.5
+# ถ้า count_tokens ของโมเดลล้มเหลว จะไม่ลองนับใหม่จนกว่าจะครบเวลานี้ (วินาที)
+COUNT_TOKENS_RETRY_SECONDS = 300
+
+# ถ้าเวลาตอบ (ค่าเฉลี่ยแบบ EMA) ของ Prompt แบบเต็มเกินค่านี้ (วินาที) จะเปลี่ยนไปใช้ Prompt แบบสั้น
+SLOW_MODEL_LATENCY_SECONDS = 20.0
+# น้ำหนักของค่าล่าสุดใน EMA (ยิ่งมาก ยิ่งตามค่าล่าสุดเร็ว)
+LATENCY_EMA_ALPHA = 0.3
+# หลังเปลี่ยนไปใช้ Prompt แบบสั้นแล้ว จะลอง Prompt แบบเต็มอีกครั้งเมื่อไม่ได้วัดผลนานเกินค่านี้ (วินาที)
+SLOW_MODEL_RETRY_SECONDS = 600
+
+# โฟลเดอร์เก็บ Roadmap ที่สร้างแล้ว (ใช้เปิดผ่านลิงก์ ?r=<id>)
+ROADMAP_STORAGE_DIR = "saved_roadmaps"
+ROADMAP_QUERY_PARAM = "r"
+ROADMAP_ID_PATTERN = re.compile(r"^[0-9a-f]{16}$")
+# จำกัดพื้นที่ที่ใช้เก็บ: ขนาดต่อไฟล์ และจำนวนไฟล์สูงสุด (เกินแล้วลบไฟล์เก่าสุดออก)
+ROADMAP_MAX_FILE_BYTES = 64 * 1024
+ROADMAP_MAX_FILES = 1000
+
 # ตั้งค่าหน้าเว็บ
 st.set_page_config(page_title=PAGE_TITLE, page_icon=PAGE_ICON, layout="wide")
 
@@ -61,11 +102,13 @@ def load_image_as_base64(file_path):
     except FileNotFoundError:
         return None
 
-def fetch_career_roadmap_from_ai(career_name):
-    """ส่งคำสั่งไปยัง Google Gemini เพื่อขอ Roadmap (พร้อมระบบ Auto-Retry โมเดลอื่น)"""
-    
-    # Prompt Template
-    prompt = f"""
+# ==========================================
+# 2.1 PROMPT MANAGEMENT & TOKEN ACCOUNTING
+# ==========================================
+
+# Prompt Templates (ใช้ {career_name} เป็นตัวแทนชื่ออาชีพ, {{ }} คือวงเล็บปีกกาจริงใน JSON)
+PROMPT_TEMPLATES = {
+    "full": """
     You are an expert Career Coach. Create a detailed 3-month study roadmap for "{career_name}" in Thai language.
 
     IMPORTANT: You must return the result as a valid JSON Object ONLY.
@@ -91,18 +134,184 @@ def fetch_career_roadmap_from_ai(career_name):
     }}
 
     Ensure the content is practical for beginners and includes homework/project ideas in the description.
-    """
+    """,
+    "compact": """
+    Career Coach: 3-month beginner study roadmap for "{career_name}", in Thai.
+    Return raw JSON only, no markdown:
+    {{"month1":{{"theme":"เป้าหมายเดือนที่ 1","weeks":[{{"week":"สัปดาห์ที่ 1","topic":"หัวข้อ","desc":"คำอธิบายสั้นๆ + การบ้าน/โปรเจกต์","link":"https://www.youtube.com/results?search_query=..."}}]}},"month2":{{...}},"month3":{{...}}}}
+    Exactly 4 weeks per month.
+    """,
+}
+
+@lru_cache(maxsize=None)
+def compile_prompt_template(variant):
+    """Minify Prompt Template ครั้งเดียว (ตัดช่องว่างหน้า/หลังบรรทัด และบรรทัดว่าง) เพื่อลด Input Tokens"""
+    lines = (line.strip() for line in PROMPT_TEMPLATES[variant].splitlines())
+    return "\n".join(line for line in lines if line)
+
+def build_prompt(career_name, variant):
+    """เติมชื่ออาชีพลงใน Template ที่ compile แล้ว"""
+    return compile_prompt_template(variant).format(career_name=career_name)
+
+@st.cache_data(show_spinner=False)
+def count_template_tokens(model_name, variant):
+    """นับจำนวน Token ของ Template (ไม่รวมชื่ออาชีพ) ด้วย count_tokens ครั้งเดียวต่อโมเดล/variant
+    (ถ้า Error จะ raise ออกไป เพื่อไม่ให้ cache_data จำผลลัพธ์ที่ล้มเหลวไว้)"""
+    model = genai.GenerativeModel(model_name)
+    return model.count_tokens(build_prompt("", variant)).total_tokens
+
+def estimate_prompt_tokens(model_name, career_name, variant):
+    """ประมาณจำนวน Input Tokens ของ Prompt โดยไม่ต้องเรียก API ทุกครั้ง
+    (นับชื่ออาชีพ 1 ตัวอักษร = 1 Token เป็นค่าเผื่อ ไม่ใช้จำนวน byte เพราะภาษาไทย 1 ตัวอักษร = 3 byte)
+    คืน None ถ้านับไม่ได้ (หลังล้มเหลวจะเว้น COUNT_TOKENS_RETRY_SECONDS ก่อนลองนับใหม่)"""
+    store = get_token_usage_store()
+    key = (model_name, variant)
+    with store["lock"]:
+        failed_until = store["count_failed_until"].get(key, 0)
+    if time.time() < failed_until:
+        return None
+
+    try:
+        template_tokens = count_template_tokens(model_name, variant)
+    except Exception as e:
+        print(f"⚠️ count_tokens failed for {model_name} ({variant}), retry in {COUNT_TOKENS_RETRY_SECONDS}s: {e}")
+        with store["lock"]:
+            store["count_failed_until"][key] = time.time() + COUNT_TOKENS_RETRY_SECONDS
+        return None
+    return template_tokens + len(career_name)
+
+@st.cache_resource
+def get_token_usage_store():
+    """สถิติการใช้ Token / เวลาตอบ ต่อโมเดล (ใช้ร่วมกันทุก Session ใน Process เดียวกัน)
+    ทุก Session รันเป็น Thread จึงต้องถือ lock ทุกครั้งที่อ่าน/เขียน models / count_failed_until"""
+    return {"lock": threading.Lock(), "models": {}, "count_failed_until": {}}
+
+def record_token_usage(model_name, variant, response, latency):
+    """บันทึก usage_metadata และเวลาตอบของแต่ละครั้งที่เรียกโมเดล"""
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+    # Thinking Tokens (โมเดล 2.5) คิดเงินเป็น Output เหมือนกัน
+    thinking_tokens = getattr(usage, "thoughts_token_count", 0) or 0
+    total_tokens = getattr(usage, "total_token_count", 0) or (prompt_tokens + output_tokens + thinking_tokens)
+
+    store = get_token_usage_store()
+    with store["lock"]:
+        stats = store["models"].setdefault(model_name, {
+            "calls": 0, "prompt_tokens": 0, "output_tokens": 0, "thinking_tokens": 0,
+            "total_tokens": 0, "total_latency": 0.0, "peak_output_tokens": 0, "latency_ema": {}
+        })
+        stats["calls"] += 1
+        stats["prompt_tokens"] += prompt_tokens
+        stats["output_tokens"] += output_tokens
+        stats["thinking_tokens"] += thinking_tokens
+        stats["total_tokens"] += total_tokens
+        stats["total_latency"] += latency
+        stats["peak_output_tokens"] = max(stats["peak_output_tokens"], output_tokens + thinking_tokens)
+        # EMA ของเวลาตอบแยกตาม variant (ค่าเก่าจางหายไป ทำให้สลับกลับได้เมื่อโมเดลเร็วขึ้น)
+        previous = stats["latency_ema"].get(variant)
+        ema = latency if previous is None else LATENCY_EMA_ALPHA * latency + (1 - LATENCY_EMA_ALPHA) * previous["ema"]
+        stats["latency_ema"][variant] = {"ema": ema, "updated": time.time()}
+        totals = dict(stats)
+
+    print(f"📊 {model_name} [{variant}] input={prompt_tokens} output={output_tokens} "
+          f"thinking={thinking_tokens} total={total_tokens} latency={latency:.1f}s")
+    # ยอดรวมสะสมต่อโมเดล (ใช้วางแผน Capacity จาก Log)
+    print(f"📈 {model_name} totals: calls={totals['calls']} input={totals['prompt_tokens']} "
+          f"output={totals['output_tokens']} thinking={totals['thinking_tokens']} "
+          f"total={totals['total_tokens']} avg_latency={totals['total_latency'] / totals['calls']:.1f}s")
+
+def get_token_usage_summary():
+    """คืนสำเนาสถิติต่อโมเดล พร้อมค่าเฉลี่ยต่อครั้ง (ข้อมูลอยู่ในหน่วยความจำ หายเมื่อ Restart)"""
+    store = get_token_usage_store()
+    with store["lock"]:
+        snapshot = {
+            name: {**stats, "latency_ema": {v: dict(e) for v, e in stats["latency_ema"].items()}}
+            for name, stats in store["models"].items()
+        }
+    for stats in snapshot.values():
+        calls = stats["calls"] or 1
+        stats["avg_prompt_tokens"] = stats["prompt_tokens"] / calls
+        stats["avg_output_tokens"] = stats["output_tokens"] / calls
+        stats["avg_thinking_tokens"] = stats["thinking_tokens"] / calls
+        stats["avg_total_tokens"] = stats["total_tokens"] / calls
+        stats["avg_latency"] = stats["total_latency"] / calls
+    return snapshot
+
+def get_token_budget(model_name):
+    """คืนค่างบประมาณ Token ของโมเดล (ถ้าไม่ได้ตั้งไว้ใช้ค่า Default)"""
+    return {**DEFAULT_TOKEN_BUDGET, **MODEL_TOKEN_BUDGETS.get(model_name, {})}
+
+def get_max_output_tokens(model_name):
+    """คำนวณ max_output_tokens จาก Output + Thinking สูงสุดที่วัดได้ (เผื่อ OUTPUT_TOKEN_HEADROOM)
+    ไม่ต่ำกว่าค่าเริ่มต้น และไม่เกินเพดานของโมเดล"""
+    budget = get_token_budget(model_name)
+    stats = get_token_usage_summary().get(model_name, {})
+    measured = int(stats.get("peak_output_tokens", 0) * OUTPUT_TOKEN_HEADROOM)
+    return min(budget["output_token_ceiling"], max(budget["max_output_tokens"], measured))
+
+def is_truncated_response(response):
+    """ตรวจว่าคำตอบถูกตัดเพราะชน max_output_tokens หรือไม่"""
+    candidates = getattr(response, "candidates", None)
+    if not candidates:
+        return False
+    finish_reason = candidates[0].finish_reason
+    return getattr(finish_reason, "name", finish_reason) == "MAX_TOKENS"
+
+def select_prompt_variant(model_name):
+    """เลือก Prompt: ใช้แบบสั้นถ้าตั้งไว้ หรือถ้า Prompt แบบเต็มของโมเดลนี้ตอบช้าเกินเกณฑ์
+    (ถ้าค่าที่วัดไว้เก่ากว่า SLOW_MODEL_RETRY_SECONDS จะลองแบบเต็มใหม่เพื่อวัดผลอีกครั้ง)"""
+    variant = get_token_budget(model_name)["variant"]
+    if variant != "full":
+        return variant
+    stats = get_token_usage_summary().get(model_name, {})
+    full_latency = stats.get("latency_ema", {}).get("full")
+    if (full_latency and full_latency["ema"] > SLOW_MODEL_LATENCY_SECONDS
+            and time.time() - full_latency["updated"] < SLOW_MODEL_RETRY_SECONDS):
+        return "compact"
+    return variant
+
+
+def fetch_career_roadmap_from_ai(career_name):
+    """ส่งคำสั่งไปยัง Google Gemini เพื่อขอ Roadmap (พร้อมระบบ Auto-Retry โมเดลอื่น)"""
 
     last_error = None
     
     # 🔄 Loop ลองใช้โมเดลทีละตัวจากรายการ
     for model_name in AVAILABLE_MODELS:
         try:
+            budget = get_token_budget(model_name)
+            variant = select_prompt_variant(model_name)
+
+            # ตรวจงบ Input Tokens: ถ้าเกินให้ลองแบบสั้น ถ้ายังเกินข้ามไปโมเดลถัดไป
+            prompt_tokens = estimate_prompt_tokens(model_name, career_name, variant)
+            if prompt_tokens is not None and prompt_tokens > budget["max_input_tokens"] and variant != "compact":
+                variant = "compact"
+                prompt_tokens = estimate_prompt_tokens(model_name, career_name, variant)
+            if prompt_tokens is not None and prompt_tokens > budget["max_input_tokens"]:
+                last_error = f"Prompt too large for {model_name} ({prompt_tokens} > {budget['max_input_tokens']} tokens)"
+                print(f"⚠️ {last_error}")
+                continue
+
             # สร้าง Model Object ภายใน loop
-            model = genai.GenerativeModel(model_name)
+            max_output_tokens = get_max_output_tokens(model_name)
+            model = genai.GenerativeModel(
+                model_name,
+                generation_config={"max_output_tokens": max_output_tokens}
+            )
             
             # ลองเรียก API
-            response = model.generate_content(prompt)
+            start_time = time.time()
+            response = model.generate_content(build_prompt(career_name, variant))
+            record_token_usage(model_name, variant, response, time.time() - start_time)
+
+            # คำตอบถูกตัดกลางทาง: JSON ไม่ครบแน่นอน ให้แจ้งแยกแล้วลองโมเดลถัดไป
+            # (usage ถูกบันทึกแล้ว ครั้งหน้า max_output_tokens ของโมเดลนี้จะเพิ่มขึ้นเอง)
+            if is_truncated_response(response):
+                last_error = f"Response truncated by max_output_tokens={max_output_tokens} ({model_name})"
+                print(f"✂️ {last_error}")
+                continue
+
             text = response.text
 
             # ถ้าสำเร็จ: Extract JSON
@@ -122,25 +331,123 @@ def fetch_career_roadmap_from_ai(career_name):
     # ถ้าลองทุกตัวแล้วยังไม่ได้
     return None, f"All models failed. Last error: {last_error}"
 
+def make_roadmap_id(career_name, data):
+    """สร้าง ID คงที่ของ Roadmap จากชื่ออาชีพ + เนื้อหา (เนื้อหาเดียวกันได้ ID เดิมเสมอ)"""
+    payload = json.dumps({"career": career_name, "data": data}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+def get_roadmap_path(roadmap_id):
+    """คืน path ของไฟล์ Roadmap (ตรวจรูปแบบ ID ก่อน เพื่อกัน path traversal)"""
+    if not roadmap_id or not ROADMAP_ID_PATTERN.match(roadmap_id):
+        return None
+    return os.path.join(ROADMAP_STORAGE_DIR, f"{roadmap_id}.json")
+
+def save_roadmap(career_name, data):
+    """บันทึก Roadmap ลงไฟล์ และคืนค่า ID สำหรับทำ Permalink (คืน None ถ้าบันทึกไม่ได้)"""
+    roadmap_id = make_roadmap_id(career_name, data)
+    path = get_roadmap_path(roadmap_id)
+    if os.path.exists(path):
+        touch_roadmap(path)
+        return roadmap_id
+
+    payload = json.dumps({"career": career_name, "data": data}, ensure_ascii=False).encode("utf-8")
+    if len(payload) > ROADMAP_MAX_FILE_BYTES:
+        print(f"⚠️ Roadmap {roadmap_id} too large to save ({len(payload)} bytes)")
+        return None
+
+    tmp_path = None
+    try:
+        os.makedirs(ROADMAP_STORAGE_DIR, exist_ok=True)
+        # เขียนลงไฟล์ชั่วคราว (ชื่อไม่ซ้ำกันแม้หลาย Session บันทึกพร้อมกัน) แล้วค่อย rename
+        # เพื่อไม่ให้คนเปิดลิงก์เจอไฟล์ที่เขียนไม่เสร็จ
+        with tempfile.NamedTemporaryFile(dir=ROADMAP_STORAGE_DIR, suffix=".tmp", delete=False) as f:
+            tmp_path = f.name
+            f.write(payload)
+        os.replace(tmp_path, path)
+        tmp_path = None
+    except OSError as e:
+        print(f"⚠️ Failed to save roadmap {roadmap_id}: {e}")
+        return None
+    finally:
+        if tmp_path:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    prune_saved_roadmaps()
+    return roadmap_id
+
+def touch_roadmap(path):
+    """อัปเดตเวลาแก้ไขไฟล์เป็นเวลาปัจจุบัน เพื่อให้ prune ลบไฟล์ที่ไม่ได้ใช้นานที่สุด (LRU) ก่อน"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+def prune_saved_roadmaps():
+    """ลบไฟล์ Roadmap ที่ไม่ได้ใช้นานที่สุดออก (ตามเวลาที่บันทึก/เปิดล่าสุด) ถ้าจำนวนไฟล์เกิน ROADMAP_MAX_FILES"""
+    try:
+        entries = [e for e in os.scandir(ROADMAP_STORAGE_DIR) if e.name.endswith(".json")]
+        if len(entries) <= ROADMAP_MAX_FILES:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+    except OSError as e:
+        print(f"⚠️ Failed to prune saved roadmaps: {e}")
+        return
+    for entry in entries[:len(entries) - ROADMAP_MAX_FILES]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass  # อาจถูก Session อื่นลบไปแล้ว
+
+def load_roadmap(roadmap_id):
+    """โหลด Roadmap จากไฟล์ตาม ID (คืนค่า (career, data) หรือ (None, None) ถ้าไม่พบ)"""
+    path = get_roadmap_path(roadmap_id)
+    if path is None:
+        return None, None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        # ValueError ครอบคลุม JSONDecodeError และ UnicodeDecodeError
+        return None, None
+    if not isinstance(record, dict) or not isinstance(record.get("data"), dict):
+        return None, None
+    touch_roadmap(path)
+    return str(record.get("career", "")), record["data"]
+
+def escape_text(value):
+    """Escape ข้อความก่อนใส่ลงใน HTML (กัน HTML/Script จากชื่ออาชีพหรือผลลัพธ์ AI)"""
+    return html.escape(str(value or ""))
+
+def safe_link(value):
+    """คืนลิงก์ที่ Escape แล้ว เฉพาะ http(s):// เท่านั้น นอกนั้นคืน '#'"""
+    link = str(value or "").strip()
+    if not re.match(r"^https?://", link, re.IGNORECASE):
+        return "#"
+    return html.escape(link)
+
 def create_roadmap_html(data, career_name):
     """สร้าง HTML String สำหรับดาวน์โหลดและ Print เป็น PDF"""
     month1 = data.get('month1', {})
     month2 = data.get('month2', {})
     month3 = data.get('month3', {})
+    career_name = escape_text(career_name)
 
     def get_weeks_html(weeks):
-        html = ""
+        weeks_html = ""
         for i, item in enumerate(weeks):
-            link = item.get('link', '#')
-            html += f"""
+            link = safe_link(item.get('link'))
+            weeks_html += f"""
             <div class="week-item">
-                <span class="week-title">🗓 {item['week']}: {item['topic']}</span>
-                <span class="week-desc">{item['desc']}</span><br>
+                <span class="week-title">🗓 {escape_text(item.get('week'))}: {escape_text(item.get('topic'))}</span>
+                <span class="week-desc">{escape_text(item.get('desc'))}</span><br>
                 <a class="week-link" href="{link}" target="_blank">🔗 แหล่งข้อมูล / โปรเจกต์</a>
             </div>"""
             if i < len(weeks) - 1:
-                html += '<div class="dashed-line"></div>'
-        return html
+                weeks_html += '<div class="dashed-line"></div>'
+        return weeks_html
 
     html_content = f"""
     <!DOCTYPE html>
@@ -196,7 +503,7 @@ def create_roadmap_html(data, career_name):
             <div class="column">
                 <div class="month-header">MONTH <span class="circle-badge">1</span></div>
                 <div class="card-box bg-month-1">
-                    <div class="theme-title">{month1.get('theme', '')}</div>
+                    <div class="theme-title">{escape_text(month1.get('theme'))}</div>
                     <div class="content">{get_weeks_html(month1.get('weeks', []))}</div>
                 </div>
             </div>
@@ -205,7 +512,7 @@ def create_roadmap_html(data, career_name):
             <div class="column">
                 <div class="month-header">MONTH <span class="circle-badge">2</span></div>
                 <div class="card-box bg-month-2">
-                    <div class="theme-title">{month2.get('theme', '')}</div>
+                    <div class="theme-title">{escape_text(month2.get('theme'))}</div>
                     <div class="content">{get_weeks_html(month2.get('weeks', []))}</div>
                 </div>
             </div>
@@ -214,7 +521,7 @@ def create_roadmap_html(data, career_name):
             <div class="column">
                 <div class="month-header">MONTH <span class="circle-badge">3</span></div>
                 <div class="card-box bg-month-3">
-                    <div class="theme-title">{month3.get('theme', '')}</div>
+                    <div class="theme-title">{escape_text(month3.get('theme'))}</div>
                     <div class="content">{get_weeks_html(month3.get('weeks', []))}</div>
                 </div>
             </div>
@@ -525,9 +832,9 @@ def draw_month_card(st_column, month_data, bg_class, month_num):
         weeks_html = ""
         weeks = month_data.get("weeks", [])
         for i, item in enumerate(weeks):
-            link = item.get('link', '#')
+            link = safe_link(item.get('link'))
             # สร้าง HTML สำหรับแต่ละสัปดาห์ (ลบ indentation ออกให้หมด)
-            weeks_html += f"""<div class="week-item"><span class="week-title">{item['week']}: {item['topic']}</span><span style="font-size:13px; color:#636e72;">{item['desc']}</span><br><span class="week-link"><a href="{link}" target="_blank">🔗 แหล่งข้อมูล / โปรเจกต์</a></span></div>"""
+            weeks_html += f"""<div class="week-item"><span class="week-title">{escape_text(item.get('week'))}: {escape_text(item.get('topic'))}</span><span style="font-size:13px; color:#636e72;">{escape_text(item.get('desc'))}</span><br><span class="week-link"><a href="{link}" target="_blank">🔗 แหล่งข้อมูล / โปรเจกต์</a></span></div>"""
             # เพิ่มเส้นคั่น ยกเว้นตัวสุดท้าย
             if i < len(weeks) - 1:
                 weeks_html += '<div class="dashed-line"></div>'
@@ -538,7 +845,7 @@ def draw_month_card(st_column, month_data, bg_class, month_num):
         full_card_html = f"""
 <div class="month-header">MONTH <span class="circle-badge">{month_num}</span></div>
 <div class="card-box {bg_class}">
-    <div class="month-theme-title">{month_data.get("theme", f"เป้าหมายเดือนที่ {month_num}")}</div>
+    <div class="month-theme-title">{escape_text(month_data.get("theme", f"เป้าหมายเดือนที่ {month_num}"))}</div>
     <details>
         <summary>👇 ดูรายละเอียด & การบ้าน</summary>
         <div style="margin-top: 15px; animation: fadeIn 0.3s ease; text-align: left;">
@@ -561,7 +868,8 @@ def init_session_state():
         "page": "search",
         "result_data": None,
         "career_query": "",
-        "error_message": None
+        "error_message": None,
+        "roadmap_id": None
     }
     for key, value in defaults.items():
         if key not in st.session_state:
@@ -571,7 +879,8 @@ def cb_start_search():
     """Callback เมื่อกดปุ่มค้นหา"""
     st.session_state.page = "loading"
     st.session_state.error_message = None
-    st.session_state.career_query = st.session_state.user_input
+    # ตัดความยาวซ้ำฝั่ง Server เผื่อกรณี max_chars ของ text_input ถูกข้าม
+    st.session_state.career_query = st.session_state.user_input.strip()[:CAREER_NAME_MAX_CHARS]
 
 def cb_reset():
     """Callback เมื่อกดปุ่มเริ่มใหม่"""
@@ -579,6 +888,10 @@ def cb_reset():
     st.session_state.result_data = None
     st.session_state.error_message = None
     st.session_state.career_query = ""
+    st.session_state.roadmap_id = None
+    # ลบ ?r=<id> ออกจาก URL เพื่อไม่ให้ Router โหลด Roadmap เดิมกลับมา (Query Param อื่นคงไว้)
+    if ROADMAP_QUERY_PARAM in st.query_params:
+        del st.query_params[ROADMAP_QUERY_PARAM]
 
 
 # ==========================================
@@ -598,7 +911,7 @@ def render_search_page():
             st.error(f"❌ {st.session_state.error_message}")
 
         with st.form("search_form"):
-            st.text_input("", placeholder="Data Scientist, UX Designer", label_visibility="collapsed", key="user_input")
+            st.text_input("", placeholder="Data Scientist, UX Designer", label_visibility="collapsed", key="user_input", max_chars=CAREER_NAME_MAX_CHARS)
             
             # ใช้ column เพื่อจัดปุ่มให้อยู่ตรงกลางสวยๆ
             b1, b2, b3 = st.columns([1, 1, 1])
@@ -630,8 +943,13 @@ def render_loading_page():
         st.session_state.error_message = error
         st.session_state.page = "search"
     else:
+        roadmap_id = save_roadmap(st.session_state.career_query, data)
         st.session_state.result_data = data
+        st.session_state.roadmap_id = roadmap_id
         st.session_state.page = "result"
+        # ใส่ ID ลงใน URL เพื่อให้ Refresh หรือแชร์ลิงก์แล้วเปิดหน้าเดิมได้ทันที
+        if roadmap_id:
+            st.query_params[ROADMAP_QUERY_PARAM] = roadmap_id
 
     st.rerun()
 
@@ -640,7 +958,7 @@ def render_result_page():
     career = st.session_state.career_query
 
     if data:
-        st.markdown(f"<h2 style='text-align:center; margin-bottom: 40px; color:#2d3436; font-weight: 700;'>🎯 Roadmap: {career}</h2>", unsafe_allow_html=True)
+        st.markdown(f"<h2 style='text-align:center; margin-bottom: 40px; color:#2d3436; font-weight: 700;'>🎯 Roadmap: {escape_text(career)}</h2>", unsafe_allow_html=True)
 
         # สร้าง 3 คอลัมน์
         c1, c2, c3 = st.columns(3)
@@ -663,6 +981,8 @@ def render_result_page():
                 use_container_width=True
             )
             st.caption("ℹ️ วิธีบันทึกเป็น PDF: เปิดไฟล์ที่ดาวน์โหลด > กด Ctrl+P (หรือ Cmd+P) > เลือก 'Save as PDF' (บันทึกเป็น PDF)")
+            if st.session_state.roadmap_id:
+                st.caption(f"🔗 แชร์ Roadmap นี้ได้ด้วยลิงก์ในแถบที่อยู่ (?{ROADMAP_QUERY_PARAM}={st.session_state.roadmap_id})")
 
     # ปุ่ม Reset
     st.markdown("<br>", unsafe_allow_html=True)
@@ -682,7 +1002,21 @@ def main():
     # ตรวจสอบว่าไฟล์พื้นหลังและไฟล์ loading มีอยู่จริง
     set_background_image('bg.jpg')
 
-    # 2. Page Router
+    # 2. Permalink: ถ้า URL มี ?r=<id> ให้โหลดจากไฟล์แล้วไปหน้าผลลัพธ์ทันที (ไม่ต้องเรียก AI)
+    roadmap_id = st.query_params.get(ROADMAP_QUERY_PARAM)
+    if roadmap_id and roadmap_id != st.session_state.roadmap_id:
+        career, data = load_roadmap(roadmap_id)
+        if data:
+            st.session_state.career_query = career
+            st.session_state.result_data = data
+            st.session_state.roadmap_id = roadmap_id
+            st.session_state.page = "result"
+        else:
+            del st.query_params[ROADMAP_QUERY_PARAM]
+            st.session_state.error_message = "ไม่พบ Roadmap จากลิงก์นี้ กรุณาสร้างใหม่อีกครั้ง"
+            st.session_state.page = "search"
+
+    # 3. Page Router
     if st.session_state.page == "search":
         render_search_page()
     elif st.session_state.page == "loading":